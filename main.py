@@ -1,19 +1,43 @@
-import openai
 import os
 import re
 import argparse
 import curses
 from curses import wrapper
 from pathlib import Path
-import textwrap
+import unicodedata
 import locale
 import sys
 import json
 import time
 import datetime
-import requests
-import threading
 import shutil
+import itertools
+import collections
+import functools
+import concurrent.futures
+
+# 解析JSON时优先使用orjson（C扩展，比标准库快数倍），缺少时回退到标准库
+# 注意：orjson.loads 接受 bytes，json.loads 同样兼容 bytes，两者可互换
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
+
+def _dump_json_bytes(data):
+    """把数据序列化为带2空格缩进的UTF-8字节串
+
+    orjson在C层直接产出UTF-8，比标准库的
+    ensure_ascii=False + indent 组合快一个数量级
+    """
+    if _json is not json:
+        return _json.dumps(data, option=_json.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+# 计算字符显示宽度时优先使用wcwidth，缺少时用标准库的东亚宽度属性近似
+try:
+    from wcwidth import wcwidth as _wcwidth
+except ImportError:
+    _wcwidth = None
 
 # 设置本地化以支持中文
 locale.setlocale(locale.LC_ALL, '')
@@ -25,6 +49,10 @@ MAX_FILE_SIZE = 1024 * 1024
 # 最大消息长度限制（防止大输入导致崩溃）
 MAX_MESSAGE_LENGTH = 5000
 
+# 主循环读键超时（毫秒）：保证限流窗口内被跳过的重绘
+# 能在窗口结束后补画，而不是等到用户下一次按键
+KEY_TIMEOUT_MS = 100
+
 # 历史记录目录
 HISTORY_DIR = Path("chat_history")
 HISTORY_DIR.mkdir(exist_ok=True)
@@ -32,6 +60,7 @@ HISTORY_DIR.mkdir(exist_ok=True)
 # 配置文件路径
 CONFIG_FILE = "config.txt"
 
+
 class ChatConfig:
     def __init__(self, name, api_base, api_key, model, request_type="openai", headers=None):
         self.name = name
@@ -42,7 +71,36 @@ class ChatConfig:
         self.headers = headers or {}
         self.provider = name  # 为了兼容原有代码
         self.is_infini = False  # 是否为Infini格式API
-    
+        self._session = None  # 惰性构建的HTTP会话，跨请求复用
+
+    @property
+    def session(self):
+        """带连接池和重试的 requests.Session，每个配置构建一次后复用"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=16,
+                max_retries=Retry(total=2, backoff_factor=0.2)
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            # 固定头部只设置一次，不必每次请求重建
+            session.headers.update({
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            })
+            if self.headers:
+                session.headers.update(self.headers)
+
+            self._session = session
+        return self._session
+
     def __str__(self):
         return f"{self.name} ({self.model})"
     
@@ -78,63 +136,61 @@ def load_configurations():
     # 如果配置文件存在，则加载
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    # 跳过空行和注释
-                    if not line or line.startswith('#'):
-                        continue
-                    
-                    # 使用 :: 分割，最多分割6次，保留头部JSON完整
-                    parts = line.split('::', 6)
-                    
-                    # 至少需要4部分
-                    if len(parts) < 4:
-                        continue
-                    
-                    # 创建配置对象
-                    name = parts[0].strip()
-                    api_base = parts[1].strip()
-                    api_key = parts[2].strip()
-                    model = parts[3].strip()
-                    
-                    # 请求类型 (默认为openai)
-                    request_type = "openai"
-                    if len(parts) > 4:
-                        request_type = parts[4].strip().lower()
-                        if request_type not in ["openai", "curl"]:
-                            request_type = "openai"
-                    
-                    # 添加自定义头部（如果存在）
-                    headers = {}
-                    if len(parts) > 5:
-                        headers_str = parts[5].strip()
-                        if headers_str:
+            # 一次性读入并批量完成 空行/注释过滤 + '::'分割（最多6次，
+            # 保留头部JSON完整），之后再逐行构建配置对象
+            raw = Path(CONFIG_FILE).read_text(encoding='utf-8')
+            rows = [
+                line.split('::', 6) for line in raw.splitlines()
+                if line.strip() and not line.lstrip().startswith('#')
+            ]
+            for parts in rows:
+                # 至少需要4部分
+                if len(parts) < 4:
+                    continue
+                
+                # 创建配置对象
+                name = parts[0].strip()
+                api_base = parts[1].strip()
+                api_key = parts[2].strip()
+                model = parts[3].strip()
+                
+                # 请求类型 (默认为openai)
+                request_type = "openai"
+                if len(parts) > 4:
+                    request_type = parts[4].strip().lower()
+                    if request_type not in ["openai", "curl"]:
+                        request_type = "openai"
+                
+                # 添加自定义头部（如果存在）
+                headers = {}
+                if len(parts) > 5:
+                    headers_str = parts[5].strip()
+                    if headers_str:
+                        try:
+                            # 尝试直接解析JSON（orjson/标准库均接受）
+                            headers = _json.loads(headers_str)
+                        except ValueError:
+                            # 尝试处理单引号或不标准JSON（保留标准库兼容路径）
                             try:
-                                # 尝试直接解析JSON
+                                headers_str = headers_str.replace("'", '"')
                                 headers = json.loads(headers_str)
-                            except json.JSONDecodeError:
-                                # 尝试处理单引号或不标准JSON
-                                try:
-                                    headers_str = headers_str.replace("'", '"')
-                                    headers = json.loads(headers_str)
-                                except:
-                                    print(f"警告: 无法解析头部JSON: {headers_str}")
-                                    headers = {}
-                            except Exception as e:
-                                print(f"解析头部JSON出错: {str(e)}")
+                            except:
+                                print(f"警告: 无法解析头部JSON: {headers_str}")
                                 headers = {}
-                    
-                    # 是否为Infini格式API
-                    is_infini = False
-                    if len(parts) > 6:
-                        infini_str = parts[6].strip().lower()
-                        if infini_str == "infini" or infini_str == "true":
-                            is_infini = True
-                    
-                    config = ChatConfig(name, api_base, api_key, model, request_type, headers)
-                    config.is_infini = is_infini
-                    configs.append(config)
+                        except Exception as e:
+                            print(f"解析头部JSON出错: {str(e)}")
+                            headers = {}
+                
+                # 是否为Infini格式API
+                is_infini = False
+                if len(parts) > 6:
+                    infini_str = parts[6].strip().lower()
+                    if infini_str == "infini" or infini_str == "true":
+                        is_infini = True
+                
+                config = ChatConfig(name, api_base, api_key, model, request_type, headers)
+                config.is_infini = is_infini
+                configs.append(config)
         except Exception as e:
             print(f"加载配置文件出错: {str(e)}，使用默认配置")
             configs = [ChatConfig(**c) for c in default_configs]
@@ -144,97 +200,121 @@ def load_configurations():
     
     return configs
 
+def _list_dir_sorted(current_dir):
+    """列出目录项并按（目录优先，名称）排序，返回 (name, path, is_dir) 列表
+
+    scandir 的目录项自带缓存的类型信息，排序键按 Schwartzian 变换在遍历时
+    计算一次，避免比较过程中反复 stat 和重复 lower()
+    """
+    with os.scandir(current_dir) as it:
+        decorated = [
+            ((not entry.is_dir(), entry.name.lower()), entry.name, entry.path, entry.is_dir())
+            for entry in it
+        ]
+    decorated.sort(key=lambda t: t[0])
+    return [(name, path, is_dir) for _, name, path, is_dir in decorated]
+
 def select_file_tui(stdscr, start_dir="."):
     """使用curses创建文件选择TUI"""
     # 保存当前curses状态
     original_cursor = curses.curs_set(1)
     stdscr.keypad(True)
+    # 本界面使用阻塞读键（聊天主循环的读键超时由主循环自行恢复）
+    stdscr.timeout(-1)
     
     current_dir = Path(start_dir).resolve()
     selected_index = 0
     scroll_offset = 0
-    
+    needs_redraw = True
+
     while True:
-        stdscr.clear()
-        height, width = stdscr.getmaxyx()
-        
-        # 显示当前路径
-        path_str = f"目录: {current_dir}"
-        stdscr.addstr(0, 0, path_str[:width-1])
-        
-        # 获取目录内容
-        try:
-            entries = list(current_dir.iterdir())
-            entries.sort(key=lambda x: (not x.is_dir(), x.name.lower()))
-        except Exception as e:
-            stdscr.addstr(1, 0, f"错误: {str(e)}")
-            stdscr.refresh()
-            stdscr.getch()
-            # 恢复curses状态
-            curses.curs_set(original_cursor)
-            return None
-        
-        # 显示文件列表
-        max_visible = height - 3
-        visible_entries = entries[scroll_offset:scroll_offset+max_visible]
-        
-        for i, entry in enumerate(visible_entries):
-            line = i + 1
-            prefix = ">" if i + scroll_offset == selected_index else " "
-            entry_type = "📁 " if entry.is_dir() else "📄 "
-            display_name = f"{prefix} {entry_type}{entry.name}"
-            
-            if line < height:
-                if i + scroll_offset == selected_index:
-                    stdscr.attron(curses.A_REVERSE)
-                    try:
-                        stdscr.addstr(line, 0, display_name[:width-1])
-                    except:
-                        pass
-                    stdscr.attroff(curses.A_REVERSE)
-                else:
-                    try:
-                        stdscr.addstr(line, 0, display_name[:width-1])
-                    except:
-                        pass
-        
-        # 显示操作提示
-        help_line = height - 1
-        help_text = "Enter: 选择 | ↑↓: 移动 | ←: 上级目录 | Esc: 取消"
-        try:
-            stdscr.addstr(help_line, 0, help_text[:width-1])
-        except:
-            pass
-        
-        stdscr.refresh()
+        # 仅在状态变化时重绘，未变化的按键不触发整屏repaint
+        if needs_redraw:
+            needs_redraw = False
+            stdscr.erase()
+            height, width = stdscr.getmaxyx()
+
+            # 显示当前路径
+            path_str = f"目录: {current_dir}"
+            stdscr.addstr(0, 0, path_str[:width-1])
+
+            # 获取目录内容
+            try:
+                entries = _list_dir_sorted(current_dir)
+            except Exception as e:
+                stdscr.addstr(1, 0, f"错误: {str(e)}")
+                stdscr.refresh()
+                stdscr.getch()
+                # 恢复curses状态
+                curses.curs_set(original_cursor)
+                return None
+
+            # 显示文件列表
+            max_visible = height - 3
+            visible_entries = entries[scroll_offset:scroll_offset+max_visible]
+
+            for i, (entry_name, entry_path, entry_is_dir) in enumerate(visible_entries):
+                line = i + 1
+                prefix = ">" if i + scroll_offset == selected_index else " "
+                entry_type = "📁 " if entry_is_dir else "📄 "
+                display_name = f"{prefix} {entry_type}{entry_name}"
+
+                if line < height:
+                    if i + scroll_offset == selected_index:
+                        stdscr.attron(curses.A_REVERSE)
+                        try:
+                            stdscr.addstr(line, 0, display_name[:width-1])
+                        except:
+                            pass
+                        stdscr.attroff(curses.A_REVERSE)
+                    else:
+                        try:
+                            stdscr.addstr(line, 0, display_name[:width-1])
+                        except:
+                            pass
+
+            # 显示操作提示
+            help_line = height - 1
+            help_text = "Enter: 选择 | ↑↓: 移动 | ←: 上级目录 | Esc: 取消"
+            try:
+                stdscr.addstr(help_line, 0, help_text[:width-1])
+            except:
+                pass
+
+            # noutrefresh+doupdate: 批量提交本次绘制，只传输一次差异
+            stdscr.noutrefresh()
+            curses.doupdate()
+
         key = stdscr.getch()
-        
+
         if key == curses.KEY_UP and selected_index > 0:
             selected_index -= 1
             if selected_index < scroll_offset:
                 scroll_offset = selected_index
+            needs_redraw = True
         elif key == curses.KEY_DOWN and selected_index < len(entries) - 1:
             selected_index += 1
             if selected_index >= scroll_offset + max_visible:
                 scroll_offset += 1
+            needs_redraw = True
         elif key == curses.KEY_LEFT:
             # 返回上级目录
             if current_dir != current_dir.parent:
                 current_dir = current_dir.parent
-                entries = list(current_dir.iterdir())
-                entries.sort(key=lambda x: (not x.is_dir(), x.name.lower()))
                 selected_index = 0
                 scroll_offset = 0
+                needs_redraw = True
         elif key == curses.KEY_RIGHT or key == 10:  # Enter键
-            selected_entry = entries[selected_index]
-            if selected_entry.is_dir():
-                current_dir = selected_entry
+            entry_name, entry_path, entry_is_dir = entries[selected_index]
+            if entry_is_dir:
+                current_dir = Path(entry_path)
                 selected_index = 0
                 scroll_offset = 0
+                needs_redraw = True
             else:
                 # 恢复curses状态
                 curses.curs_set(original_cursor)
-                return str(selected_entry)
+                return entry_path
         elif key == 27:  # ESC键
             # 恢复curses状态
             curses.curs_set(original_cursor)
@@ -245,72 +325,88 @@ def select_provider_tui(stdscr, configs):
     # 保存当前curses状态
     original_cursor = curses.curs_set(1)
     stdscr.keypad(True)
+    # 本界面使用阻塞读键（聊天主循环的读键超时由主循环自行恢复）
+    stdscr.timeout(-1)
     
     selected_index = 0
     scroll_offset = 0
-    
+    needs_redraw = True
+
+    # 每行的静态部分只格式化一次，重绘时仅拼接选中前缀
+    row_suffixes = [
+        f" {config.name} - {config.model} ({config.request_type})"
+        + (" [Infini]" if config.is_infini else "")
+        for config in configs
+    ]
+
     while True:
-        stdscr.clear()
-        height, width = stdscr.getmaxyx()
-        
-        try:
-            stdscr.addstr(0, 0, "选择API配置:")
-        except:
-            pass
-        
-        # 显示配置列表
-        max_visible = height - 3
-        visible_configs = configs[scroll_offset:scroll_offset+max_visible]
-        
-        for i, config in enumerate(visible_configs):
-            line = i + 1
-            prefix = ">" if i + scroll_offset == selected_index else " "
-            infini_mark = " [Infini]" if config.is_infini else ""
-            display_text = f"{prefix} {config.name} - {config.model} ({config.request_type}){infini_mark}"
-            
-            if line < height:
-                if i + scroll_offset == selected_index:
-                    stdscr.attron(curses.A_REVERSE)
-                    try:
-                        stdscr.addstr(line, 0, display_text[:width-1])
-                    except:
-                        pass
-                    stdscr.attroff(curses.A_REVERSE)
-                else:
-                    try:
-                        stdscr.addstr(line, 0, display_text[:width-1])
-                    except:
-                        pass
-        
-        # 显示滚动提示
-        if scroll_offset > 0:
+        # 仅在状态变化时重绘
+        if needs_redraw:
+            needs_redraw = False
+            stdscr.erase()
+            height, width = stdscr.getmaxyx()
+
             try:
-                stdscr.addstr(0, width-5, "↑")
+                stdscr.addstr(0, 0, "选择API配置:")
             except:
                 pass
-        if scroll_offset + max_visible < len(configs):
+
+            # 显示配置列表
+            max_visible = height - 3
+            visible_suffixes = row_suffixes[scroll_offset:scroll_offset+max_visible]
+
+            for i, row_suffix in enumerate(visible_suffixes):
+                line = i + 1
+                prefix = ">" if i + scroll_offset == selected_index else " "
+                display_text = prefix + row_suffix
+
+                if line < height:
+                    if i + scroll_offset == selected_index:
+                        stdscr.attron(curses.A_REVERSE)
+                        try:
+                            stdscr.addstr(line, 0, display_text[:width-1])
+                        except:
+                            pass
+                        stdscr.attroff(curses.A_REVERSE)
+                    else:
+                        try:
+                            stdscr.addstr(line, 0, display_text[:width-1])
+                        except:
+                            pass
+
+            # 显示滚动提示
+            if scroll_offset > 0:
+                try:
+                    stdscr.addstr(0, width-5, "↑")
+                except:
+                    pass
+            if scroll_offset + max_visible < len(configs):
+                try:
+                    stdscr.addstr(height-1, width-5, "↓")
+                except:
+                    pass
+
+            help_text = "Enter: 选择 | ↑↓: 移动 | Esc: 取消"
             try:
-                stdscr.addstr(height-1, width-5, "↓")
+                stdscr.addstr(height-1, 0, help_text[:width-1])
             except:
                 pass
-        
-        help_text = "Enter: 选择 | ↑↓: 移动 | Esc: 取消"
-        try:
-            stdscr.addstr(height-1, 0, help_text[:width-1])
-        except:
-            pass
-        
-        stdscr.refresh()
+
+            stdscr.noutrefresh()
+            curses.doupdate()
+
         key = stdscr.getch()
-        
+
         if key == curses.KEY_UP and selected_index > 0:
             selected_index -= 1
             if selected_index < scroll_offset:
                 scroll_offset = selected_index
+            needs_redraw = True
         elif key == curses.KEY_DOWN and selected_index < len(configs) - 1:
             selected_index += 1
             if selected_index >= scroll_offset + max_visible:
                 scroll_offset += 1
+            needs_redraw = True
         elif key == 10:  # Enter键
             # 恢复curses状态
             curses.curs_set(original_cursor)
@@ -320,49 +416,162 @@ def select_provider_tui(stdscr, configs):
             curses.curs_set(original_cursor)
             return None
 
+def _char_width(ch):
+    """单个字符占用的终端列数"""
+    if _wcwidth is not None:
+        w = _wcwidth(ch)
+        return w if w > 0 else 0
+    return 2 if unicodedata.east_asian_width(ch) in 'FW' else 1
+
+def _fast_wrap(line, width):
+    """按终端宽度切分单行文本，替代热路径上的 textwrap.wrap
+
+    纯ASCII行直接切片（无需正则分词）；含宽字符的行按显示宽度累加切分，
+    避免把占两列的CJK字符切在单元格中间
+    """
+    if width <= 0:
+        return [line]
+    # ASCII快路径：每个字符恰好一列，切片即可
+    if line.isascii():
+        return [line[i:i+width] for i in range(0, len(line), width)] or [""]
+
+    result = []
+    current = []
+    current_width = 0
+    for ch in line:
+        w = _char_width(ch)
+        if current and current_width + w > width:
+            result.append(''.join(current))
+            current = []
+            current_width = 0
+        current.append(ch)
+        current_width += w
+    result.append(''.join(current))
+    return result
+
+# 标题里的空白字符归一化表：translate一遍完成，无需链式replace
+_TITLE_TBL = str.maketrans({'\n': ' ', '\r': ' ', '\t': ' '})
+
+# 文件内容块的起始标记；渲染时按它分段，块内第一个```视为闭合围栏
+_FILE_MARK = "```文件内容:"
+
+# {{:F<文件名>}} 标记的正则，模块加载时编译一次
+_FILE_TAG_RE = re.compile(r'\{\{:F([^}]+)\}\}')
+
+# 文件占位符的内部标记形式: \x00F<id>\x00（id索引 file_placeholders 字典）
+# 渲染/保存时经单遍regex替换回 {{:F路径}}，避免对每条消息逐占位符扫描替换
+_PLACEHOLDER_RE = re.compile('\x00F(\\d+)\x00')
+
+# SSE流式事件的快速路径：大多数行只需取出 delta.content 一个字符串，
+# 直接在bytes上用正则提取，免去为每个事件构建完整dict；
+# 含转义序列或带结束标志的行回退到完整JSON解析
+_SSE_CONTENT_RE = re.compile(rb'"content"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_SSE_DONE_RE = re.compile(rb'"done"\s*:\s*true|"finish_reason"\s*:\s*"')
+
+# 文件内容缓存: 路径 -> (mtime, size, content)
+# 同一文件在一条消息中出现多次（或多次发送）时不重复读盘
+_file_tag_cache = {}
+
+def _read_tag_file(file_path):
+    """读取标记引用的文件内容，按 (mtime, size) 缓存"""
+    st = os.stat(file_path)
+    cached = _file_tag_cache.get(file_path)
+    if cached is not None and cached[0] == st.st_mtime and cached[1] == st.st_size:
+        return cached[2]
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    _file_tag_cache[file_path] = (st.st_mtime, st.st_size, content)
+    return content
+
+def _substitute_file_tag(match):
+    """将单个 {{:F...}} 匹配替换为文件内容（或错误提示）"""
+    file_path = match.group(1).strip()
+    try:
+        # 检查文件是否存在
+        if not os.path.exists(file_path):
+            return f"[文件不存在: {file_path}]"
+
+        # 检查文件大小
+        file_size = os.path.getsize(file_path)
+        if file_size > MAX_FILE_SIZE:
+            return f"[文件过大(>{MAX_FILE_SIZE/1024}KB): {file_path}]"
+
+        # 读取文件内容（带缓存）
+        content = _read_tag_file(file_path)
+
+        return f"\n```文件内容:{file_path}\n{content}\n```\n"
+
+    except Exception as e:
+        return f"[读取文件出错: {str(e)}]"
+
 def replace_file_tags(input_str):
     """
     替换输入字符串中的 {{:F<文件名>}} 标记为文件内容
+
+    使用预编译正则的单遍 sub，避免对每个标记整串 str.replace
     """
-    # 使用正则表达式查找所有 {{:F...}} 模式
-    pattern = r'\{\{:F([^}]+)\}\}'
-    matches = re.findall(pattern, input_str)
-    
-    for file_path in matches:
-        file_path = file_path.strip()
-        try:
-            # 检查文件是否存在
-            if not os.path.exists(file_path):
-                input_str = input_str.replace(f"{{{{:F{file_path}}}}}", f"[文件不存在: {file_path}]")
-                continue
-            
-            # 检查文件大小
-            file_size = os.path.getsize(file_path)
-            if file_size > MAX_FILE_SIZE:
-                input_str = input_str.replace(f"{{{{:F{file_path}}}}}", f"[文件过大(>{MAX_FILE_SIZE/1024}KB): {file_path}]")
-                continue
-            
-            # 读取文件内容
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 替换标记
-            input_str = input_str.replace(f"{{{{:F{file_path}}}}}", f"\n```文件内容:{file_path}\n{content}\n```\n")
-        
-        except Exception as e:
-            input_str = input_str.replace(f"{{{{:F{file_path}}}}}", f"[读取文件出错: {str(e)}]")
-    
-    return input_str
+    return _FILE_TAG_RE.sub(_substitute_file_tag, input_str)
+
+@functools.lru_cache(maxsize=1024)
+def _fmt_minute(ts_minute):
+    """把按分钟取整的时间戳格式化为显示字符串
+
+    列表里的格式粒度只有分钟，按整分钟做key缓存后
+    strftime 对同一分钟的重复调用只付一次代价
+    """
+    return datetime.datetime.fromtimestamp(ts_minute * 60).strftime('%Y-%m-%d %H:%M')
+
+# 历史记录元数据缓存: 路径 -> (mtime, 摘要字典)
+# 避免方向键导航时每次重绘都重新解析所有可见的JSON文件
+_hist_meta_cache = {}
+
+def _history_summary(file_path, mtime=None):
+    """读取单个历史记录文件的列表摘要，按mtime缓存，文件未变动时不重新解析
+
+    调用方若已通过 scandir 拿到 mtime 可直接传入，避免重复 stat
+    """
+    if mtime is None:
+        mtime = file_path.stat().st_mtime
+    cached = _hist_meta_cache.get(file_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(file_path, 'rb') as f:
+        data = _json.loads(f.read())
+    timestamp = data.get('timestamp', 0)
+    date_str = _fmt_minute(int(timestamp) // 60)
+    title = data.get('title', "未命名对话")
+    # 首条用户消息的截断在缓存写入时计算一次，而不是每次重绘都做
+    first_message = ""
+    for msg in data['messages']:
+        if msg['role'] == 'user':
+            content = msg['content'].translate(_TITLE_TBL)
+            if len(content) > 30:
+                content = content[:30] + "..."
+            first_message = f" | 用户: {content}"
+            break
+
+    # 整行静态文本在缓存写入时拼好，重绘只需加上选中前缀
+    summary = {'row': f" {date_str} - {title}{first_message}"}
+    _hist_meta_cache[file_path] = (mtime, summary)
+    return summary
 
 def view_history_tui(stdscr):
     """查看历史记录的TUI界面"""
     # 保存当前curses状态
     original_cursor = curses.curs_set(1)
     stdscr.keypad(True)
+    # 本界面使用阻塞读键（聊天主循环的读键超时由主循环自行恢复）
+    stdscr.timeout(-1)
     
     # 获取所有历史记录文件
-    history_files = list(HISTORY_DIR.glob("*.json"))
-    history_files.sort(key=os.path.getmtime, reverse=True)
+    # scandir 的目录项自带缓存的 stat 结果，一次遍历同时拿到路径和 mtime，
+    # 避免 glob + getmtime 对每个文件的额外 stat 调用
+    with os.scandir(HISTORY_DIR) as it:
+        history_files = [(Path(entry.path), entry.stat().st_mtime)
+                         for entry in it if entry.name.endswith('.json')]
+    history_files.sort(key=lambda t: t[1], reverse=True)
     
     if not history_files:
         stdscr.addstr(0, 0, "没有历史记录")
@@ -373,80 +582,75 @@ def view_history_tui(stdscr):
     
     selected_index = 0
     scroll_offset = 0
-    
+    needs_redraw = True
+
     # 第一级：历史记录列表
     while True:
-        stdscr.clear()
-        height, width = stdscr.getmaxyx()
-        
-        # 显示标题
-        title = "历史记录 (Enter查看详情, Esc返回)"
-        stdscr.addstr(0, 0, title[:width-1])
-        
-        # 显示历史记录列表
-        max_visible = height - 3
-        visible_files = history_files[scroll_offset:scroll_offset+max_visible]
-        
-        for i, file_path in enumerate(visible_files):
-            line = i + 1
-            prefix = ">" if i + scroll_offset == selected_index else " "
-            
-            # 读取文件元数据
+        # 仅在状态变化时重绘
+        if needs_redraw:
+            needs_redraw = False
+            stdscr.erase()
+            height, width = stdscr.getmaxyx()
+
+            # 显示标题
+            title = "历史记录 (Enter查看详情, Esc返回)"
+            stdscr.addstr(0, 0, title[:width-1])
+
+            # 显示历史记录列表
+            max_visible = height - 3
+            visible_files = history_files[scroll_offset:scroll_offset+max_visible]
+
+            for i, (file_path, mtime) in enumerate(visible_files):
+                line = i + 1
+                prefix = ">" if i + scroll_offset == selected_index else " "
+
+                # 读取文件元数据（带mtime缓存，未变动的文件不会重新解析）
+                try:
+                    display_text = prefix + _history_summary(file_path, mtime)['row']
+                except:
+                    display_text = f"{prefix} {file_path.name}"
+
+                if line < height:
+                    if i + scroll_offset == selected_index:
+                        stdscr.attron(curses.A_REVERSE)
+                        try:
+                            stdscr.addstr(line, 0, display_text[:width-1])
+                        except:
+                            pass
+                        stdscr.attroff(curses.A_REVERSE)
+                    else:
+                        try:
+                            stdscr.addstr(line, 0, display_text[:width-1])
+                        except:
+                            pass
+
+            # 显示操作提示
+            help_text = "↑↓: 移动 | Enter: 查看详情 | Esc: 返回"
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    timestamp = data.get('timestamp', 0)
-                    date_str = datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
-                    title = data.get('title', "未命名对话")
-                    first_message = ""
-                    for msg in data['messages']:
-                        if msg['role'] == 'user':
-                            content = msg['content'].replace('\n', ' ')
-                            if len(content) > 30:
-                                content = content[:30] + "..."
-                            first_message = f" | 用户: {content}"
-                            break
-                    
-                    display_text = f"{prefix} {date_str} - {title}{first_message}"
+                stdscr.addstr(height-1, 0, help_text[:width-1])
             except:
-                display_text = f"{prefix} {file_path.name}"
-            
-            if line < height:
-                if i + scroll_offset == selected_index:
-                    stdscr.attron(curses.A_REVERSE)
-                    try:
-                        stdscr.addstr(line, 0, display_text[:width-1])
-                    except:
-                        pass
-                    stdscr.attroff(curses.A_REVERSE)
-                else:
-                    try:
-                        stdscr.addstr(line, 0, display_text[:width-1])
-                    except:
-                        pass
-        
-        # 显示操作提示
-        help_text = "↑↓: 移动 | Enter: 查看详情 | Esc: 返回"
-        try:
-            stdscr.addstr(height-1, 0, help_text[:width-1])
-        except:
-            pass
-        
-        stdscr.refresh()
+                pass
+
+            stdscr.noutrefresh()
+            curses.doupdate()
+
         key = stdscr.getch()
-        
+
         if key == curses.KEY_UP and selected_index > 0:
             selected_index -= 1
             if selected_index < scroll_offset:
                 scroll_offset = selected_index
+            needs_redraw = True
         elif key == curses.KEY_DOWN and selected_index < len(history_files) - 1:
             selected_index += 1
             if selected_index >= scroll_offset + max_visible:
                 scroll_offset += 1
+            needs_redraw = True
         elif key == 10:  # Enter键
-            selected_file = history_files[selected_index]
+            selected_file = history_files[selected_index][0]
             view_single_history(stdscr, selected_file)
-            stdscr.clear()
+            stdscr.erase()
+            needs_redraw = True
         elif key == 27:  # ESC键
             break
     
@@ -465,14 +669,14 @@ def view_single_history(stdscr, file_path):
     curses.init_pair(1, curses.COLOR_CYAN, curses.COLOR_BLACK)  # 用户消息
     curses.init_pair(2, curses.COLOR_YELLOW, curses.COLOR_BLACK)  # AI消息
     
-    # 读取历史记录
+    # 读取历史记录（以二进制读取后交给orjson解析）
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(file_path, 'rb') as f:
+            data = _json.loads(f.read())
             messages = data.get('messages', [])
             title = data.get('title', "未命名对话")
             timestamp = data.get('timestamp', 0)
-            date_str = datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+            date_str = _fmt_minute(int(timestamp) // 60)
     except Exception as e:
         stdscr.addstr(0, 0, f"读取历史记录失败: {str(e)}")
         stdscr.refresh()
@@ -481,71 +685,184 @@ def view_single_history(stdscr, file_path):
         return
     
     scroll_offset = 0
-    height, width = stdscr.getmaxyx()
-    
+    needs_redraw = True
+    display_lines = []
+    wrapped_width = None
+
     # 第二级：历史记录详情
     while True:
-        stdscr.clear()
-        height, width = stdscr.getmaxyx()
-        
-        # 显示标题
-        title_line = f"{title} - {date_str} (Esc返回)"
-        stdscr.addstr(0, 0, title_line[:width-1])
-        
-        # 显示消息
-        display_lines = []
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"]
-            
-            # 根据角色设置颜色属性
-            color_attr = curses.color_pair(1) if role == "user" else curses.color_pair(2)
-            
-            # 处理内容换行
-            lines = content.split('\n')
-            for line in lines:
-                # 对长行进行换行处理
-                wrapped = textwrap.wrap(line, width)
-                for wline in wrapped:
-                    # 存储行内容和颜色属性
-                    display_lines.append((wline, color_attr))
-        
-        # 显示消息
-        max_visible = height - 2
-        visible_lines = display_lines[scroll_offset:scroll_offset+max_visible]
-        
-        for i, (line, color_attr) in enumerate(visible_lines):
-            if i < height - 1:
+        # 仅在状态变化时重绘
+        if needs_redraw:
+            needs_redraw = False
+            stdscr.erase()
+            height, width = stdscr.getmaxyx()
+
+            # 消息内容不变，仅在宽度变化时重新换行
+            if width != wrapped_width:
+                wrapped_width = width
+                display_lines = []
+                # 两个颜色属性循环外取一次
+                user_attr = curses.color_pair(1)
+                ai_attr = curses.color_pair(2)
+                for msg in messages:
+                    role = msg["role"]
+                    content = msg["content"]
+
+                    # 根据角色设置颜色属性
+                    color_attr = user_attr if role == "user" else ai_attr
+
+                    # 处理内容换行
+                    lines = content.split('\n')
+                    for line in lines:
+                        # 对长行进行换行处理
+                        wrapped = _fast_wrap(line, width)
+                        for wline in wrapped:
+                            # 存储行内容和颜色属性
+                            display_lines.append((wline, color_attr))
+
+            # 显示标题
+            title_line = f"{title} - {date_str} (Esc返回)"
+            stdscr.addstr(0, 0, title_line[:width-1])
+
+            # 显示消息
+            max_visible = height - 2
+            visible_lines = display_lines[scroll_offset:scroll_offset+max_visible]
+
+            for i, (line, color_attr) in enumerate(visible_lines):
+                if i < height - 1:
+                    try:
+                        stdscr.addstr(i+1, 0, line[:width-1], color_attr)
+                    except:
+                        pass
+
+            # 显示滚动提示
+            if scroll_offset > 0:
                 try:
-                    stdscr.addstr(i+1, 0, line[:width-1], color_attr)
+                    stdscr.addstr(0, width-5, "↑", curses.A_BOLD)
                 except:
                     pass
-        
-        # 显示滚动提示
-        if scroll_offset > 0:
-            try:
-                stdscr.addstr(0, width-5, "↑", curses.A_BOLD)
-            except:
-                pass
-        if scroll_offset + max_visible < len(display_lines):
-            try:
-                stdscr.addstr(height-1, width-5, "↓", curses.A_BOLD)
-            except:
-                pass
-        
-        stdscr.refresh()
+            if scroll_offset + max_visible < len(display_lines):
+                try:
+                    stdscr.addstr(height-1, width-5, "↓", curses.A_BOLD)
+                except:
+                    pass
+
+            stdscr.noutrefresh()
+            curses.doupdate()
+
         key = stdscr.getch()
-        
+
         if key == curses.KEY_UP and scroll_offset > 0:
             scroll_offset -= 1
+            needs_redraw = True
         elif key == curses.KEY_DOWN and scroll_offset < len(display_lines) - max_visible:
             scroll_offset += 1
+            needs_redraw = True
         elif key == 27:  # ESC键
             break
     
     # 恢复curses状态
     curses.curs_set(original_cursor)
 
+class _GapBuffer:
+    """光标编辑用的间隙缓冲：左右两个码点栈，光标落在两栈之间
+
+    在光标处插入/删除只动左栈末尾，O(1)均摊；移动光标在两栈间
+    搬运单个元素。完整字符串只在重绘或发送需要时join一次并缓存。
+    """
+
+    def __init__(self, text=""):
+        self.left = list(text)
+        self.right = []  # 逆序存放光标右侧的码点，栈顶即光标后第一个字符
+        self._text_cache = text
+        self._dirty = False
+
+    @property
+    def text(self):
+        if self._dirty:
+            self._text_cache = ''.join(self.left) + ''.join(reversed(self.right))
+            self._dirty = False
+        return self._text_cache
+
+    @property
+    def pos(self):
+        return len(self.left)
+
+    def __len__(self):
+        return len(self.left) + len(self.right)
+
+    def set_text(self, text, pos=None):
+        """整体替换内容，光标默认移到末尾"""
+        self.left = list(text)
+        self.right = []
+        self._text_cache = text
+        self._dirty = False
+        if pos is not None:
+            self.move_to(pos)
+
+    def insert(self, chars):
+        self.left.extend(chars)
+        self._dirty = True
+
+    def _marker_start(self):
+        """左栈以完整的 \\x00F<id>\\x00 文件占位符标记结尾时返回其起始下标，否则-1"""
+        left = self.left
+        i = len(left) - 2
+        while i >= 0 and left[i].isdigit():
+            i -= 1
+        if i >= 1 and i < len(left) - 2 and left[i] == 'F' and left[i - 1] == '\x00':
+            return i - 1
+        return -1
+
+    def backspace(self):
+        if not self.left:
+            return
+        if self.left[-1] == '\x00':
+            # 文件占位符标记整体删除：删掉单个码点会留下落单的NUL，
+            # 既无法还原成 {{:F路径}} 又会原样发送出去
+            start = self._marker_start()
+            if start >= 0:
+                del self.left[start:]
+                self._dirty = True
+                return
+        self.left.pop()
+        self._dirty = True
+
+    def move_left(self):
+        if not self.left:
+            return
+        if self.left[-1] == '\x00':
+            # 占位符标记按一个整体跨过，光标不落进标记内部
+            start = self._marker_start()
+            if start >= 0:
+                while len(self.left) > start:
+                    self.right.append(self.left.pop())
+                return
+        self.right.append(self.left.pop())
+
+    def move_right(self):
+        right = self.right
+        if not right:
+            return
+        # 右栈逆序存放，栈顶向下依次是 \x00、F、若干数字、\x00
+        if right[-1] == '\x00' and len(right) >= 4 and right[-2] == 'F':
+            i = len(right) - 3
+            while i >= 0 and right[i].isdigit():
+                i -= 1
+            if i >= 0 and i < len(right) - 3 and right[i] == '\x00':
+                while len(right) > i:
+                    self.left.append(right.pop())
+                return
+        self.left.append(right.pop())
+
+    def move_to(self, pos):
+        pos = max(0, min(pos, len(self)))
+        while len(self.left) > pos:
+            self.right.append(self.left.pop())
+        while len(self.left) < pos:
+            self.left.append(self.right.pop())
+
+
 class ChatUI:
     def __init__(self, stdscr, configs):
         self.stdscr = stdscr
@@ -554,19 +871,62 @@ class ChatUI:
         self.messages = []
         self.input_history = []
         self.history_index = -1
-        self.current_input = ""
-        self.cursor_pos = 0
-        self.file_placeholders = {}  # 存储文件占位符信息
+        # 输入缓冲用间隙缓冲存储，光标处插入/删除为O(1)均摊；
+        # current_input/cursor_pos 属性按需join并缓存，避免每个按键整串重建
+        self._input_buf = _GapBuffer()
+        self.file_placeholders = {}  # 文件占位符: id -> 文件路径
+        self._next_placeholder_id = 1  # 占位符id分配计数
+        self._input_cursor_x = len("> ")  # 输入行光标列位置
+        # 流式响应的token批处理状态：攒够一批再刷新，而不是逐token重绘
+        self._pending_tokens = []
+        self._pending_chars = 0
+        self._last_stream_flush = 0
+        self._stream_chunks = []  # 已接收的全部token，需要整串时才join
+        self._stream_len = 0  # 运行中的总长度计数，避免整串len
         self.last_redraw_time = 0
         self.redraw_throttle = 0.1  # 限制重绘频率（秒）
+        self._needs_refresh = False  # 有待提交到物理屏幕的绘制内容
+        self._redraw_pending = False  # 有被限流跳过、待主循环补画的重绘
         self.dirty = False  # 标记是否需要重绘消息区域
         self.last_message_count = 0  # 记录上次消息数量
-        self.cached_lines = []  # 缓存消息行
-        
+        # 渲染只保留最近N条消息：重绘代价与会话总长度无关
+        self._visible_tail_limit = 200
+        # 渲染环形缓存：每个元素是一条稳定消息（最后一条之外）换行后的
+        # (文本, 颜色) 行列表；装满后追加自动把最老的消息挤出，O(1)淘汰
+        self._render_ring = collections.deque(maxlen=self._visible_tail_limit)
+        self._ring_msg_count = 0  # _render_ring 已覆盖到的消息下标
+        self._wrap_width = 0  # _render_ring 对应的终端宽度
+        # 流式消息的增量换行缓存：已完成（以'\n'结尾的）行只wrap一次，
+        # 每个chunk只处理末尾新增的部分
+        self._tail_wrap_key = None  # (消息对象id, 终端宽度)
+        self._tail_wrap_consumed = 0  # 已缓存部分在展示文本中的结束位置
+        self._tail_wrap_lines = []  # 已缓存部分的 (文本, 颜色) 行
+        # 倒数第二条消息在流式期间不变，整条缓存
+        self._penult_wrap_key = None
+        self._penult_wrap_lines = []
+        
+        # 网络请求工作线程池：复用固定数量的线程，避免每次发送都创建新线程
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        # 当前流式响应写入的assistant消息dict（send_message时指向新占位）
+        self._assistant_slot = None
+        # 第一条用户消息（保存时做对话标题用），省去每次save整表扫描
+        self._first_user_msg = None
+
         # 命令模式相关属性
         self.command_mode = False
-        self.command_input = ""
-        self.command_cursor_pos = 0
+        self._cmd_buf = _GapBuffer()
+        # 命令表：完整命令与短别名映射到同一处理函数，按词精确匹配；
+        # 一次字典查找代替链式 startswith（'s'不再吞掉save以外的命令）
+        self._cmd_table = {
+            'file': self._cmd_file, 'f': self._cmd_file,
+            'provider': self._cmd_provider, 'p': self._cmd_provider,
+            'clear': self._cmd_clear, 'cr': self._cmd_clear,
+            'save': self._cmd_save, 's': self._cmd_save,
+            'load': self._cmd_load, 'l': self._cmd_load,
+            'history': self._cmd_history, 'h': self._cmd_history,
+            'clean': self._cmd_clean, 'cn': self._cmd_clean,
+            'exit': self._cmd_exit, 'quit': self._cmd_exit,
+        }
         self.saved_input = ""  # 保存进入命令模式前的输入内容
         self.saved_cursor_pos = 0  # 保存进入命令模式前的光标位置
         
@@ -580,226 +940,398 @@ class ChatUI:
         curses.init_pair(5, curses.COLOR_MAGENTA, -1)  # 文件内容
         curses.init_pair(6, curses.COLOR_RED, -1)      # 错误消息
         curses.init_pair(7, curses.COLOR_BLUE, -1)     # 历史记录标题
+
+        # 颜色属性只查一次并缓存：渲染循环每行都要用，
+        # 不必每次跨C边界重新计算attr位掩码
+        self._COLOR_TITLE = curses.color_pair(1)
+        self._COLOR_USER = curses.color_pair(2)
+        self._COLOR_AI = curses.color_pair(3)
+        self._COLOR_SYS = curses.color_pair(4)
+        self._COLOR_FILE = curses.color_pair(5)
+        self._COLOR_ERR = curses.color_pair(6)
         
         # 设置窗口
         self.stdscr.keypad(True)
         curses.curs_set(1)
         self.height, self.width = self.stdscr.getmaxyx()
-        
+
         # 启用UTF-8支持
         self.stdscr.encoding = 'utf-8'
-        
-    def safe_addstr(self, y, x, text, attr=None):
+
+        # 将屏幕拆分为三个独立窗口：标题栏、消息区、输入区
+        # 各窗口只在自身内容变化时重绘，并通过 noutrefresh + doupdate 批量提交
+        self._create_windows()
+
+    def _create_windows(self):
+        """按当前终端尺寸创建标题/消息/输入三个子窗口"""
+        # 消息区行数与原来 stdscr 上的第2行..第h-4行保持一致
+        self.msg_height = max(1, self.height - 5)
+        self.header_win = curses.newwin(2, self.width, 0, 0)
+        self.msg_win = curses.newwin(self.msg_height, self.width, 2, 0)
+        self.input_win = curses.newwin(3, self.width, self.height - 3, 0)
+
+    @property
+    def current_input(self):
+        """当前输入内容；从间隙缓冲按需join，结果缓存到下次编辑"""
+        return self._input_buf.text
+
+    @current_input.setter
+    def current_input(self, value):
+        self._input_buf.set_text(value)
+
+    @property
+    def cursor_pos(self):
+        return self._input_buf.pos
+
+    @cursor_pos.setter
+    def cursor_pos(self, value):
+        self._input_buf.move_to(value)
+
+    @property
+    def command_input(self):
+        return self._cmd_buf.text
+
+    @command_input.setter
+    def command_input(self, value):
+        self._cmd_buf.set_text(value)
+
+    @property
+    def command_cursor_pos(self):
+        return self._cmd_buf.pos
+
+    @command_cursor_pos.setter
+    def command_cursor_pos(self, value):
+        self._cmd_buf.move_to(value)
+
+    def safe_addstr(self, y, x, text, attr=None, win=None):
         """安全添加字符串，避免边界错误"""
+        if win is None:
+            win = self.stdscr
         try:
             if attr:
-                self.stdscr.attron(attr)
-            # 尝试使用UTF-8编码输出
-            if isinstance(text, str):
-                text = text.encode('utf-8', 'ignore').decode('utf-8', 'ignore')
-            self.stdscr.addstr(y, x, text[:self.width-1])
+                win.attron(attr)
+            # locale已在模块加载时初始化，curses可直接输出UTF-8，
+            # 无需每次调用都encode/decode往返拷贝一遍字符串
+            win.addstr(y, x, text[:self.width-1])
             if attr:
-                self.stdscr.attroff(attr)
+                win.attroff(attr)
         except curses.error:
             pass
         except UnicodeEncodeError:
-            # 如果编码失败，使用忽略错误的方式
+            # 极少数无法编码的字符，做一次替换后重试
             try:
-                text = text.encode('utf-8', 'ignore').decode('utf-8', 'ignore')
-                self.stdscr.addstr(y, x, text[:self.width-1])
+                text = text.encode('utf-8', 'replace').decode('utf-8')
+                win.addstr(y, x, text[:self.width-1])
             except:
                 pass
-    
+
     def display_header(self):
-        """显示标题栏"""
+        """显示标题栏（绘制到 header_win）"""
+        self.header_win.erase()
         title = f"AI聊天助手 (提供商: {self.current_config.name}, 模型: {self.current_config.model.split('/')[-1]})"
         infini_mark = " [Infini]" if self.current_config.is_infini else ""
-        self.safe_addstr(0, 0, title + infini_mark, curses.color_pair(1))
-        
+        self.safe_addstr(0, 0, title + infini_mark, self._COLOR_TITLE, win=self.header_win)
+
         # 分隔线
         try:
-            self.stdscr.hline(1, 0, curses.ACS_HLINE, self.width)
+            self.header_win.hline(1, 0, curses.ACS_HLINE, self.width)
         except:
             pass
-        
+        self.header_win.noutrefresh()
+
+    def _placeholder_to_tag(self, match):
+        """把单个内部占位符标记还原为 {{:F路径}} 形式"""
+        file_path = self.file_placeholders.get(int(match.group(1)))
+        return f"{{{{:F{file_path}}}}}" if file_path else match.group(0)
+
+    def _markers_to_tags(self, content):
+        """单遍regex把内容中的所有占位符标记还原为 {{:F路径}}"""
+        return _PLACEHOLDER_RE.sub(self._placeholder_to_tag, content)
+
+    def _wrap_message(self, msg):
+        """将单条消息转换为带颜色属性的换行后显示行列表"""
+        display_lines = []
+        role = msg["role"]
+        content = msg["content"]
+
+        # 根据角色设置颜色
+        if role == "user":
+            prefix = "用户: "
+            color = self._COLOR_USER
+        elif role == "assistant":
+            prefix = "AI: "
+            color = self._COLOR_AI
+        else:
+            prefix = "系统: "
+            color = self._COLOR_SYS
+
+        # 处理文件内容标记：find单遍扫描交替产出普通文本/文件内容段，
+        # 只切出要显示的片段，不再“先按标记split再按```嵌套split”两层扫描
+        pos = content.find(_FILE_MARK)
+        if pos != -1:
+            display_lines.append((content[:pos], color))
+            while pos != -1:
+                seg_start = pos + len(_FILE_MARK)
+                nxt = content.find(_FILE_MARK, seg_start)
+                seg_end = len(content) if nxt == -1 else nxt
+                close = content.find("```", seg_start, seg_end)
+                if close != -1:
+                    display_lines.append(("文件内容:" + content[seg_start:close], self._COLOR_FILE))
+                    display_lines.append((content[close + 3:seg_end], color))
+                else:
+                    # 块未闭合：到下一个标记（或串尾）为止都按文件内容显示
+                    display_lines.append(("文件内容:" + content[seg_start:seg_end], self._COLOR_FILE))
+                pos = nxt
+        else:
+            # 在用户界面显示 {{:F路径}} 标记而不是文件内容（单遍替换）
+            display_content = self._markers_to_tags(content)
+
+            # 添加前缀
+            display_content = prefix + display_content
+
+            # 正确处理换行：先按原始换行符分割
+            lines = display_content.split('\n')
+            for line in lines:
+                # 对每一行进行自动换行处理
+                wrapped_lines = _fast_wrap(line, self.width)
+                if wrapped_lines:
+                    for wrapped_line in wrapped_lines:
+                        display_lines.append((wrapped_line, color))
+                else:
+                    # 空行
+                    display_lines.append(("", color))
+
+        return display_lines
+
+    def invalidate_message_cache(self):
+        """消息列表被整体替换（clear/load）时调用，丢弃已缓存的换行结果"""
+        self._render_ring.clear()
+        self._ring_msg_count = 0
+        self._tail_wrap_key = None
+        self._penult_wrap_key = None
+
+    def _wrap_streaming_tail(self, msg):
+        """增量换行最后一条（流式追加中的）消息
+
+        流式更新只在末尾追加文本：以'\n'结尾的完整行wrap一次后缓存，
+        每个chunk只需重新wrap末尾未完成的那一行。含文件内容块或
+        占位符标记时回退到整条重算。
+        """
+        content = msg["content"]
+        if "```文件内容:" in content or '\x00' in content:
+            return self._wrap_message(msg)
+
+        role = msg["role"]
+        if role == "user":
+            text = "用户: " + content
+            color = self._COLOR_USER
+        elif role == "assistant":
+            text = "AI: " + content
+            color = self._COLOR_AI
+        else:
+            text = "系统: " + content
+            color = self._COLOR_SYS
+
+        # 按消息列表长度作键：同一次流式响应中最后一条的槽位不变，
+        # 新响应开始（列表长度变化）或终端宽度变化时缓存自动失效
+        key = (len(self.messages), self.width)
+        if key != self._tail_wrap_key or self._tail_wrap_consumed > len(text):
+            self._tail_wrap_key = key
+            self._tail_wrap_consumed = 0
+            self._tail_wrap_lines = []
+
+        # 新增部分中已完成的行一次性wrap进缓存
+        nl = text.rfind('\n')
+        if nl >= self._tail_wrap_consumed:
+            for line in text[self._tail_wrap_consumed:nl].split('\n'):
+                for wrapped in _fast_wrap(line, self.width):
+                    self._tail_wrap_lines.append((wrapped, color))
+            self._tail_wrap_consumed = nl + 1
+
+        # 末尾未完成的行（通常只有几十个字符）每次重wrap
+        tail = [(wrapped, color)
+                for wrapped in _fast_wrap(text[self._tail_wrap_consumed:], self.width)]
+        return self._tail_wrap_lines + tail
+
     def display_messages(self):
-        """显示聊天消息 - 修复版本，添加自动换行"""
-        # 计算消息显示区域 - 从第2行开始（索引2对应第三行）
-        start_line = 2  # 修改为从第三行开始显示消息
-        end_line = self.height - 3
-        max_lines = end_line - start_line
-        
+        """显示聊天消息 - 修复版本，添加自动换行（绘制到 msg_win）"""
+        # 消息区即整个 msg_win，行号从0开始
+        start_line = 0
+        end_line = self.msg_height
+
         # 清空消息区域
-        for i in range(start_line, end_line):
-            try:
-                self.stdscr.move(i, 0)
-                self.stdscr.clrtoeol()
-            except:
-                pass
-        
-        # 显示所有消息（不再使用缓存）
-        display_lines = []
-        for msg in self.messages:
-            role = msg["role"]
-            content = msg["content"]
-            
-            # 根据角色设置颜色
-            if role == "user":
-                prefix = "用户: "
-                color = curses.color_pair(2)
-            elif role == "assistant":
-                prefix = "AI: "
-                color = curses.color_pair(3)
-            else:
-                prefix = "系统: "
-                color = curses.color_pair(4)
-            
-            # 处理文件内容标记
-            if "```文件内容:" in content:
-                parts = content.split("```文件内容:")
-                for i, part in enumerate(parts):
-                    if i > 0:
-                        file_part = part.split("```", 1)
-                        if len(file_part) > 1:
-                            display_lines.append(("文件内容:" + file_part[0], curses.color_pair(5)))
-                            display_lines.append((file_part[1], color))
-                        else:
-                            display_lines.append(("文件内容:" + file_part[0], curses.color_pair(5)))
-                    else:
-                        display_lines.append((part, color))
-            else:
-                # 在用户界面显示占位符而不是文件内容
-                display_content = content
-                for placeholder, file_path in self.file_placeholders.items():
-                    if placeholder in display_content:
-                        display_content = display_content.replace(placeholder, f"{{{{:F{file_path}}}}}")
-                
-                # 添加前缀
-                display_content = prefix + display_content
-                
-                # 正确处理换行：先按原始换行符分割
-                lines = display_content.split('\n')
-                for line in lines:
-                    # 对每一行进行自动换行处理
-                    wrapped_lines = textwrap.wrap(line, self.width)
-                    if wrapped_lines:
-                        for wrapped_line in wrapped_lines:
-                            display_lines.append((wrapped_line, color))
-                    else:
-                        # 空行
-                        display_lines.append(("", color))
-        
-        # 显示消息（从底部向上）
-        line_index = len(display_lines) - 1
+        self.msg_win.erase()
+
+        # 增量换行：除最后一条外的消息不会再变化，按消息缓存在
+        # _render_ring 里；每次重绘只换行新增消息和仍在流式更新的最后一条。
+        # 环形缓存装满后追加即淘汰最老的消息，重绘和缓存内存都与会话总长度无关
+        stable_count = max(0, len(self.messages) - 1)
+        if self._wrap_width != self.width or self._ring_msg_count > stable_count:
+            # 终端宽度变化或消息被整体替换，重建缓存
+            self._render_ring.clear()
+            self._ring_msg_count = max(0, stable_count - self._visible_tail_limit)
+            self._wrap_width = self.width
+        elif stable_count - self._ring_msg_count > self._visible_tail_limit:
+            # 一次性新增超过窗口容量（如批量加载），跳过注定上不了屏的部分
+            self._render_ring.clear()
+            self._ring_msg_count = stable_count - self._visible_tail_limit
+
+        # 缓存项同时记录消息和换行时的内容长度：流式槽位之后插入了
+        # 系统消息时，半截响应会先一步进缓存，之后的原地追加靠长度
+        # 变化检测出来并重新换行（与update_last_message的倒二缓存同键）
+        for msg in self.messages[self._ring_msg_count:stable_count]:
+            self._render_ring.append([msg, len(msg["content"]), self._wrap_message(msg)])
+        self._ring_msg_count = stable_count
+
+        # 显示消息（从底部向上）：先画仍在流式追加的最后一条（即时换行，
+        # 不进缓存），再逐条回填环形缓存里的消息，填满消息区即停
         row = end_line - 1
-        
-        # 确保不会覆盖输入区域
-        max_row = self.height - 4  # 输入区域上方留出空间
-        
-        while row >= start_line and line_index >= 0 and row <= max_row:
-            line, color = display_lines[line_index]
-            self.safe_addstr(row, 0, line, color)
-            row -= 1
-            line_index -= 1
-    
+        if self.messages:
+            tail_lines = self._wrap_message(self.messages[-1])
+        else:
+            tail_lines = []
+        for entry in itertools.chain(([None, 0, tail_lines],), reversed(self._render_ring)):
+            msg, wrapped_len, lines = entry
+            if msg is not None and wrapped_len != len(msg["content"]):
+                lines = self._wrap_message(msg)
+                entry[1] = len(msg["content"])
+                entry[2] = lines
+            for line, color in reversed(lines):
+                if row < start_line:
+                    break
+                self.safe_addstr(row, 0, line, color, win=self.msg_win)
+                row -= 1
+            if row < start_line:
+                break
+
+        self.msg_win.noutrefresh()
+
     def display_input(self):
-        """显示输入框"""
+        """显示输入框（绘制到 input_win 的第0/1行）"""
         # 输入区域分隔线
         try:
-            # 清除可能的覆盖
-            for i in range(self.height - 3, self.height):
-                self.stdscr.move(i, 0)
-                self.stdscr.clrtoeol()
-            
-            self.stdscr.hline(self.height - 3, 0, curses.ACS_HLINE, self.width)
+            self.input_win.erase()
+            self.input_win.hline(0, 0, curses.ACS_HLINE, self.width)
         except:
             pass
-        
+
         # 输入提示
         prompt = "> "
-        
+
         if self.command_mode:
             # 命令模式下的显示
-            self.safe_addstr(self.height - 2, 0, "命令: " + self.command_input)
+            self.safe_addstr(1, 0, "命令: " + self.command_input, win=self.input_win)
             # 设置光标位置
             cursor_x = len("命令: ") + self.command_cursor_pos
+            self._input_cursor_x = cursor_x
             try:
-                self.stdscr.move(self.height - 2, cursor_x)
+                self.input_win.move(1, cursor_x)
             except:
                 pass
         else:
             # 普通模式下的显示
-            self.safe_addstr(self.height - 2, 0, prompt)
-            
+            self.safe_addstr(1, 0, prompt, win=self.input_win)
+
+            # 输入行展示时把内部占位符标记还原为 {{:F路径}}；
+            # 光标列按还原后的前缀长度计算，保证占位符之后的光标位置准确
+            shown_input = self.current_input
+            shown_cursor = self.cursor_pos
+            if self.file_placeholders:
+                shown_input = self._markers_to_tags(shown_input)
+                if shown_cursor == len(self.current_input):
+                    # 光标在末尾（最常见情况）：无需再扫描一次前缀
+                    shown_cursor = len(shown_input)
+                else:
+                    shown_cursor = len(self._markers_to_tags(self.current_input[:self.cursor_pos]))
+
             # 显示输入内容
             max_input_width = self.width - len(prompt) - 1
-            display_input = self.current_input
-            
+            display_input = shown_input
+
             # 如果输入内容过长，显示尾部部分
             if len(display_input) > max_input_width:
-                start_idx = max(0, len(self.current_input) - max_input_width)
-                display_input = self.current_input[start_idx:]
+                start_idx = max(0, len(shown_input) - max_input_width)
+                display_input = shown_input[start_idx:]
                 if start_idx > 0:
                     display_input = "..." + display_input
-            
+
             # 显示输入文本
-            self.safe_addstr(self.height - 2, len(prompt), display_input)
-            
+            self.safe_addstr(1, len(prompt), display_input, win=self.input_win)
+
             # 设置光标位置
-            display_pos = max(0, self.cursor_pos - (len(self.current_input) - len(display_input)))
+            display_pos = max(0, shown_cursor - (len(shown_input) - len(display_input)))
             if display_input.startswith("..."):
                 display_pos += 3  # 跳过 "..." 前缀
-                
+
             cursor_x = len(prompt) + min(len(display_input), display_pos)
+            self._input_cursor_x = cursor_x
             try:
-                self.stdscr.move(self.height - 2, cursor_x)
+                self.input_win.move(1, cursor_x)
             except:
                 pass
-    
+
     def display_help(self):
-        """显示帮助信息"""
+        """显示帮助信息（input_win 的最后一行）"""
         help_text = "命令: Ctrl+L 输入命令 file=文件 provider=切换 clear=清除 exit=退出 save=保存 load=加载 history=查看历史"
-        self.safe_addstr(self.height - 1, 0, help_text)
-    
+        self.safe_addstr(2, 0, help_text, win=self.input_win)
+
+    def _refresh_input_win(self):
+        """提交输入区绘制；光标跟随 input_win，故其 noutrefresh 必须最后执行"""
+        # 重新定位光标（display_help 的绘制会移动窗口光标）
+        try:
+            self.input_win.move(1, self._input_cursor_x)
+        except:
+            pass
+        self.input_win.noutrefresh()
+
     def redraw(self, force=False):
-        """重绘整个界面，带有限流"""
+        """重绘整个界面，带有限流；返回本次是否真正绘制
+
+        被限流跳过时置 _redraw_pending，主循环读键超时后会补画，
+        保证合并窗口内的最后一帧不会丢
+        """
         current_time = time.time()
         if not force and current_time - self.last_redraw_time < self.redraw_throttle:
-            return
-            
+            self._redraw_pending = True
+            return False
+
+        self._redraw_pending = False
         self.last_redraw_time = current_time
-        self.stdscr.clear()
+        if force:
+            # 可能有其它界面（文件/历史TUI）直接写过屏幕，强制整窗重传
+            self.header_win.touchwin()
+            self.msg_win.touchwin()
+            self.input_win.touchwin()
         self.display_header()
         self.display_messages()
         self.display_input()
         self.display_help()
-        self.stdscr.refresh()
-    
+        self._refresh_input_win()
+        # 不在此处doupdate：一次按键可能触发多次重绘，
+        # 统一由主循环在阻塞读键前刷一次屏
+        self._needs_refresh = True
+        return True
+
     def redraw_input_only(self):
         """仅重绘输入区域，提高性能"""
-        # 清除输入区域
-        try:
-            self.stdscr.move(self.height - 3, 0)
-            self.stdscr.clrtobot()
-        except:
-            pass
-        
-        # 重新绘制输入区域
-        try:
-            self.stdscr.hline(self.height - 3, 0, curses.ACS_HLINE, self.width)
-        except:
-            pass
-        
         self.display_input()
         self.display_help()
-        self.stdscr.refresh()
+        self._refresh_input_win()
+        self._needs_refresh = True
     
     def process_input(self, key):
         """处理用户输入 - 修复后台切换问题"""
+        # get_wch 对普通字符返回str、功能键返回int；
+        # 单字符的控制字符归一化为码点，复用下面原有的整数分支。
+        # Tab是可输入的正文字符（粘贴代码常见），保持str走插入分支
+        if isinstance(key, str) and len(key) == 1 and key != '\t' \
+                and (ord(key) < 32 or ord(key) == 127):
+            key = ord(key)
+
         # 处理命令模式
         if self.command_mode:
             return self.process_command_input(key)
-        
+
         # 处理控制键
         if key == curses.KEY_ENTER or key == 10 or key == 13:
             # 发送消息
@@ -836,85 +1368,36 @@ class ChatUI:
         
         elif key == curses.KEY_LEFT:
             # 向左移动光标
-            if self.cursor_pos > 0:
-                self.cursor_pos -= 1
+            self._input_buf.move_left()
             self.redraw_input_only()
             return False
-        
+
         elif key == curses.KEY_RIGHT:
             # 向右移动光标
-            if self.cursor_pos < len(self.current_input):
-                self.cursor_pos += 1
+            self._input_buf.move_right()
             self.redraw_input_only()
             return False
-        
+
         elif key == curses.KEY_BACKSPACE or key == 127:
-            # 退格删除
-            if self.cursor_pos > 0:
-                # 删除单个字符
-                self.current_input = self.current_input[:self.cursor_pos-1] + self.current_input[self.cursor_pos:]
-                self.cursor_pos -= 1
+            # 退格删除（只动间隙缓冲左栈栈顶，无整串拷贝）
+            self._input_buf.backspace()
             self.redraw_input_only()
             return False
-        
+
         elif key == 27:  # ESC键
             return self.handle_command("exit")
         
         else:
-            # 处理字符输入（包括中文）
-            char = None
-            
-            # 修复：检查按键值是否在有效范围内
-            if key < 0 or key > 0x10FFFF:  # Unicode最大码点
-                # 无效的按键值，忽略
-                return False
-            
-            # 处理多字节字符（如中文）
-            if key > 127:
-                # 收集可能的UTF-8字节序列
-                bytes_seq = [key]
-                self.stdscr.nodelay(True)  # 临时设置非阻塞模式
-                
-                # 尝试读取后续字节（最多2个，因为UTF-8最多4字节，但中文通常是3字节）
-                for _ in range(2):
-                    next_key = self.stdscr.getch()
-                    # 修复：检查按键值是否有效
-                    if next_key != -1 and 0 <= next_key <= 255:
-                        bytes_seq.append(next_key)
-                    else:
-                        break
-                
-                self.stdscr.nodelay(False)  # 恢复阻塞模式
-                
-                # 将字节序列转换为字符串
-                try:
-                    byte_string = bytes(bytes_seq)
-                    char = byte_string.decode('utf-8')
-                except UnicodeDecodeError:
-                    # 如果解码失败，只使用第一个字节
-                    try:
-                        char = chr(bytes_seq[0])
-                    except:
-                        char = None
-                except ValueError:
-                    # 处理无效字节值
-                    char = None
-            else:
-                # ASCII字符
-                try:
-                    char = chr(key)
-                except:
-                    char = None
-            
-            if char:
-                # 插入字符到当前位置
-                self.current_input = self.current_input[:self.cursor_pos] + char + self.current_input[self.cursor_pos:]
-                self.cursor_pos += len(char)
-            
+            # 处理字符输入（包括中文）：get_wch 直接给出完整字符，
+            # 无需再拼装UTF-8字节流
+            if isinstance(key, str):
+                # 插入字符到当前位置（只动间隙缓冲左栈，无整串拷贝）
+                self._input_buf.insert(key)
+
             # 只重绘输入区域
             self.redraw_input_only()
             return False
-    
+
     def enter_command_mode(self):
         """进入命令模式"""
         self.command_mode = True
@@ -953,246 +1436,227 @@ class ChatUI:
         
         elif key == curses.KEY_BACKSPACE or key == 127:
             # 退格删除
-            if self.command_cursor_pos > 0:
-                # 删除单个字符
-                self.command_input = self.command_input[:self.command_cursor_pos-1] + self.command_input[self.command_cursor_pos:]
-                self.command_cursor_pos -= 1
+            self._cmd_buf.backspace()
             self.redraw_input_only()
             return False
-        
+
         elif key == curses.KEY_LEFT:
             # 向左移动光标
-            if self.command_cursor_pos > 0:
-                self.command_cursor_pos -= 1
+            self._cmd_buf.move_left()
             self.redraw_input_only()
             return False
-        
+
         elif key == curses.KEY_RIGHT:
             # 向右移动光标
-            if self.command_cursor_pos < len(self.command_input):
-                self.command_cursor_pos += 1
+            self._cmd_buf.move_right()
             self.redraw_input_only()
             return False
-        
+
         else:
-            # 处理字符输入（包括中文）
-            char = None
-            
-            # 修复：检查按键值是否在有效范围内
-            if key < 0 or key > 0x10FFFF:  # Unicode最大码点
-                # 无效的按键值，忽略
-                return False
-            
-            # 处理多字节字符（如中文）
-            if key > 127:
-                # 收集可能的UTF-8字节序列
-                bytes_seq = [key]
-                self.stdscr.nodelay(True)  # 临时设置非阻塞模式
-                
-                # 尝试读取后续字节（最多2个，因为UTF-8最多4字节，但中文通常是3字节）
-                for _ in range(2):
-                    next_key = self.stdscr.getch()
-                    # 修复：检查按键值是否有效
-                    if next_key != -1 and 0 <= next_key <= 255:
-                        bytes_seq.append(next_key)
-                    else:
-                        break
-                
-                self.stdscr.nodelay(False)  # 恢复阻塞模式
-                
-                # 将字节序列转换为字符串
-                try:
-                    byte_string = bytes(bytes_seq)
-                    char = byte_string.decode('utf-8')
-                except UnicodeDecodeError:
-                    # 如果解码失败，只使用第一个字节
-                    try:
-                        char = chr(bytes_seq[0])
-                    except:
-                        char = None
-                except ValueError:
-                    # 处理无效字节值
-                    char = None
-            else:
-                # ASCII字符
-                try:
-                    char = chr(key)
-                except:
-                    char = None
-            
-            if char:
+            # 处理字符输入（包括中文）：get_wch 直接给出完整字符
+            if isinstance(key, str):
                 # 插入字符到当前位置
-                self.command_input = self.command_input[:self.command_cursor_pos] + char + self.command_input[self.command_cursor_pos:]
-                self.command_cursor_pos += len(char)
+                self._cmd_buf.insert(key)
             
             # 只重绘输入区域
             self.redraw_input_only()
             return False
     
     def handle_command(self, command=None):
-        """处理命令"""
-        if command.startswith('file') or command.startswith('f'):
-            selected_file = select_file_tui(self.stdscr)
-            if selected_file:
-                # 使用唯一占位符避免自动展开
-                placeholder = f"{{{{:F{selected_file}}}}}"
-                
-                # 如果当前输入不为空，在末尾添加空格和占位符
-                if self.saved_input:
-                    self.saved_input += " " + placeholder
-                    self.saved_cursor_pos = len(self.saved_input)
-                else:
-                    # 如果输入为空，直接使用占位符
-                    self.saved_input = placeholder
-                    self.saved_cursor_pos = len(placeholder)
-                
-                # 存储占位符信息
-                self.file_placeholders[placeholder] = selected_file
-                
-                # 重绘输入区域显示占位符
-                self.redraw_input_only()
-            return False
-        
-        elif command.startswith('provider') or command.startswith('p'):
-            selected_config = select_provider_tui(self.stdscr, self.configs)
-            if selected_config:
-                self.current_config = selected_config
-                self.add_system_message(f"已切换到: {selected_config.name} ({selected_config.model})")
-            self.redraw(force=True)
-            return False
-        
-        elif command.startswith('clear') or command.startswith('cr'):
-            self.messages = []
-            self.file_placeholders = {}  # 清除占位符
-            self.add_system_message("对话历史已清除")
-            self.redraw(force=True)
-            return False
-        
-        elif command.startswith('save') or command.startswith('s'):
-            # 获取文件名（如果有）
-            parts = command.split(' ', 1)
-            filename = parts[1] if len(parts) > 1 else None
-            
-            if not filename:
-                # 生成默认文件名
-                timestamp = int(time.time())
-                filename = f"chat_{timestamp}.json"
-            
-            # 确保是JSON文件
-            if not filename.endswith('.json'):
-                filename += '.json'
-            
-            # 保存文件
+        """处理命令：按第一个词在命令表里精确查找后分发"""
+        verb, _, rest = command.partition(' ')
+        handler = self._cmd_table.get(verb)
+        if handler is not None:
+            return handler(rest.strip())
+
+        # 处理未知命令
+        self.add_system_message(f"未知命令: {verb}", is_error=True)
+        return False
+
+    def _cmd_file(self, rest):
+        """file/f: 选择文件并以占位符形式插入输入"""
+        selected_file = select_file_tui(self.stdscr)
+        if selected_file:
+            # 分配唯一id的内部标记，渲染时再还原为 {{:F路径}} 展示
+            placeholder_id = self._next_placeholder_id
+            self._next_placeholder_id += 1
+            placeholder = f"\x00F{placeholder_id}\x00"
+
+            # 如果当前输入不为空，在末尾添加空格和占位符
+            if self.saved_input:
+                self.saved_input += " " + placeholder
+                self.saved_cursor_pos = len(self.saved_input)
+            else:
+                # 如果输入为空，直接使用占位符
+                self.saved_input = placeholder
+                self.saved_cursor_pos = len(placeholder)
+
+            # 存储占位符信息
+            self.file_placeholders[placeholder_id] = selected_file
+
+            # 选中的文件此刻起就确定会被发送：后台线程预读进
+            # (mtime, size) 缓存，发送时的展开直接命中，不再卡住UI
+            self._executor.submit(self._prefetch_file, selected_file)
+
+        # 文件选择界面接管过整个屏幕，取消时也要整屏重绘恢复
+        self.redraw(force=True)
+        return False
+
+    @staticmethod
+    def _prefetch_file(file_path):
+        """后台预热文件内容缓存；失败留给发送路径报告"""
+        try:
+            if os.path.getsize(file_path) <= MAX_FILE_SIZE:
+                _read_tag_file(file_path)
+        except Exception:
+            pass
+
+    def _cmd_provider(self, rest):
+        """provider/p: 切换API配置"""
+        selected_config = select_provider_tui(self.stdscr, self.configs)
+        if selected_config:
+            self.current_config = selected_config
+            self.add_system_message(f"已切换到: {selected_config.name} ({selected_config.model})")
+        self.redraw(force=True)
+        return False
+
+    def _cmd_clear(self, rest):
+        """clear/cr: 清除对话历史"""
+        self.messages = []
+        self.file_placeholders = {}  # 清除占位符
+        self._first_user_msg = None
+        self.invalidate_message_cache()
+        self.add_system_message("对话历史已清除")
+        self.redraw(force=True)
+        return False
+
+    def _cmd_save(self, rest):
+        """save/s: 保存对话，可带文件名参数"""
+        filename = rest or None
+
+        if not filename:
+            # 生成默认文件名
+            timestamp = int(time.time())
+            filename = f"chat_{timestamp}.json"
+
+        # 确保是JSON文件
+        if not filename.endswith('.json'):
+            filename += '.json'
+
+        # 保存文件
+        file_path = HISTORY_DIR / filename
+
+        # 对话标题取自缓存的第一条用户消息，不再整表扫描
+        title = "未命名对话"
+        if self._first_user_msg is not None:
+            title = self._markers_to_tags(self._first_user_msg).translate(_TITLE_TBL)[:20] + "..."
+
+        # 在保存前恢复占位符格式
+        messages_to_save = []
+        for msg in self.messages:
+            # 只保存用户和AI消息，跳过系统消息
+            if msg['role'] == 'system':
+                continue
+
+            if msg['role'] == 'user':
+                # 占位符标记以 {{:F路径}} 形式持久化
+                content = self._markers_to_tags(msg['content'])
+                messages_to_save.append({"role": msg['role'], "content": content})
+            else:
+                messages_to_save.append(msg)
+
+        data = {
+            'timestamp': int(time.time()),
+            'title': title,
+            'provider': self.current_config.name,
+            'model': self.current_config.model,
+            'messages': messages_to_save
+        }
+
+        try:
+            # 一次性写出序列化好的字节串，避免stdlib逐字符的缩进/转义循环
+            Path(file_path).write_bytes(_dump_json_bytes(data))
+            self.add_system_message(f"对话已保存到: {file_path}")
+        except Exception as e:
+            self.add_system_message(f"保存失败: {str(e)}", is_error=True)
+        self.redraw(force=True)
+        return False
+
+    def _cmd_load(self, rest):
+        """load/l: 加载历史对话，可带文件名参数"""
+        filename = rest or None
+
+        if filename:
+            # 直接加载指定文件
             file_path = HISTORY_DIR / filename
-            
-            # 尝试获取对话标题（第一条用户消息）
-            title = "未命名对话"
-            for msg in self.messages:
-                if msg['role'] == 'user':
-                    title = msg['content'].replace('\n', ' ')[:20] + "..."
-                    break
-            
-            # 在保存前恢复占位符格式
-            messages_to_save = []
-            for msg in self.messages:
-                # 只保存用户和AI消息，跳过系统消息
-                if msg['role'] == 'system':
-                    continue
-                    
-                if msg['role'] == 'user':
-                    content = msg['content']
-                    for placeholder, file_path_val in self.file_placeholders.items():
-                        if placeholder in content:
-                            content = content.replace(placeholder, f"{{{{:F{file_path_val}}}}}")
-                    messages_to_save.append({"role": msg['role'], "content": content})
-                else:
-                    messages_to_save.append(msg)
-            
-            data = {
-                'timestamp': int(time.time()),
-                'title': title,
-                'provider': self.current_config.name,
-                'model': self.current_config.model,
-                'messages': messages_to_save
-            }
-            
+            if not file_path.exists():
+                self.add_system_message(f"文件不存在: {file_path}", is_error=True)
+                return False
+
+            self.load_history(file_path)
+        else:
+            # 显示文件选择界面
+            file_path = select_file_tui(self.stdscr, str(HISTORY_DIR))
+            if file_path:
+                self.load_history(Path(file_path))
+        self.redraw(force=True)
+        return False
+
+    def _cmd_history(self, rest):
+        """history/h: 进入历史记录查看界面"""
+        view_history_tui(self.stdscr)
+        self.redraw(force=True)
+        return False
+
+    def _cmd_clean(self, rest):
+        """clean/cn: 清理所有历史记录文件"""
+        # 确认操作
+        self.add_system_message("确定要清理所有历史记录吗？(y/n)")
+        self.redraw(force=True)
+
+        # 阻塞等待确认前先把提示刷上屏
+        curses.doupdate()
+        self._needs_refresh = False
+
+        # 等待用户确认（主循环读键带超时，这里临时恢复阻塞，
+        # 避免超时返回的-1被当成"取消"）
+        self.stdscr.timeout(-1)
+        key = self.stdscr.getch()
+        self.stdscr.timeout(KEY_TIMEOUT_MS)
+        if key == ord('y') or key == ord('Y'):
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                self.add_system_message(f"对话已保存到: {file_path}")
+                # 删除历史记录目录
+                if HISTORY_DIR.exists():
+                    shutil.rmtree(HISTORY_DIR)
+
+                # 重新创建目录
+                HISTORY_DIR.mkdir(exist_ok=True)
+
+                self.add_system_message("所有历史记录已清理")
             except Exception as e:
-                self.add_system_message(f"保存失败: {str(e)}", is_error=True)
-            self.redraw(force=True)
-            return False
-        
-        elif command.startswith('load') or command.startswith('l'):
-            # 获取文件名（如果有）
-            parts = command.split(' ', 1)
-            filename = parts[1] if len(parts) > 1 else None
-            
-            if filename:
-                # 直接加载指定文件
-                file_path = HISTORY_DIR / filename
-                if not file_path.exists():
-                    self.add_system_message(f"文件不存在: {file_path}", is_error=True)
-                    return False
-                
-                self.load_history(file_path)
-            else:
-                # 显示文件选择界面
-                file_path = select_file_tui(self.stdscr, str(HISTORY_DIR))
-                if file_path:
-                    self.load_history(Path(file_path))
-            self.redraw(force=True)
-            return False
-        
-        elif command.startswith('history') or command.startswith('h'):
-            # 进入历史记录查看界面
-            view_history_tui(self.stdscr)
-            self.redraw(force=True)
-            return False
-        
-        # 添加清理缓存命令
-        elif command.startswith('clean') or command.startswith('cn'):
-            # 确认操作
-            self.add_system_message("确定要清理所有历史记录吗？(y/n)")
-            self.redraw(force=True)
-            
-            # 等待用户确认
-            key = self.stdscr.getch()
-            if key == ord('y') or key == ord('Y'):
-                try:
-                    # 删除历史记录目录
-                    if HISTORY_DIR.exists():
-                        shutil.rmtree(HISTORY_DIR)
-                    
-                    # 重新创建目录
-                    HISTORY_DIR.mkdir(exist_ok=True)
-                    
-                    self.add_system_message("所有历史记录已清理")
-                except Exception as e:
-                    self.add_system_message(f"清理失败: {str(e)}", is_error=True)
-            else:
-                self.add_system_message("清理操作已取消")
-            
-            self.redraw(force=True)
-            return False
-        
-        elif command.startswith('exit') or command.startswith('quit'):
-            return True
-        
-        # 处理未知命令
-        self.add_system_message(f"未知命令: {command.split()[0] if ' ' in command else command}", is_error=True)
+                self.add_system_message(f"清理失败: {str(e)}", is_error=True)
+        else:
+            self.add_system_message("清理操作已取消")
+
+        self.redraw(force=True)
         return False
-    
+
+    def _cmd_exit(self, rest):
+        """exit/quit: 退出程序"""
+        return True
+
     def load_history(self, file_path):
         """加载历史记录"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(file_path, 'rb') as f:
+                data = _json.loads(f.read())
                 # 只加载用户和AI消息，不加载系统消息
-                self.messages = [msg for msg in data.get('messages', []) 
+                self.messages = [msg for msg in data.get('messages', [])
                                  if msg['role'] in ['user', 'assistant']]
+                self._first_user_msg = next(
+                    (msg['content'] for msg in self.messages if msg['role'] == 'user'),
+                    None)
+                self.invalidate_message_cache()
                 provider = data.get('provider', 'OpenRouter')
                 model = data.get('model', 'deepseek/deepseek-r1:free')
                 
@@ -1211,20 +1675,65 @@ class ChatUI:
                 self.add_system_message(f"已加载历史记录: {file_path.name}")
                 self.add_system_message(f"提供商: {provider}, 模型: {model}")
                 
-                # 重建文件占位符
+                # 历史记录中的 {{:F路径}} 标签本身即显示形式，
+                # 发送时由 replace_file_tags 直接展开，无需重建占位符
                 self.file_placeholders = {}
-                for msg in self.messages:
-                    if msg['role'] == 'user':
-                        content = msg['content']
-                        matches = re.findall(r'\{\{:F([^}]+)\}\}', content)
-                        for file_path in matches:
-                            placeholder = f"{{{{:F{file_path}}}}}"
-                            self.file_placeholders[placeholder] = file_path
         except Exception as e:
             self.add_system_message(f"加载失败: {str(e)}", is_error=True)
     
+    def _stream_begin(self):
+        """开始接收一次流式响应，重置批处理状态"""
+        self._pending_tokens = []
+        self._pending_chars = 0
+        self._stream_chunks = []
+        self._stream_len = 0
+        self._last_stream_flush = time.time()
+
+    def _stream_add(self, content):
+        """缓冲一个流式token；攒够64字符或距上次刷新超过50ms才真正重绘"""
+        self._pending_tokens.append(content)
+        self._pending_chars += len(content)
+        if self._pending_chars >= 64 or time.time() - self._last_stream_flush >= 0.05:
+            self._flush_stream()
+
+    def _flush_stream(self):
+        """把缓冲的token合并进最后一条消息并重绘一次"""
+        if self._pending_tokens:
+            # token累积在列表里，长度用计数器跟踪；
+            # 避免逐次 str += 依赖CPython的原地realloc优化
+            self._stream_chunks.extend(self._pending_tokens)
+            self._stream_len += self._pending_chars
+            self._pending_tokens = []
+            self._pending_chars = 0
+
+            # 截断过长的响应
+            if self._stream_len > MAX_MESSAGE_LENGTH:
+                text = ''.join(self._stream_chunks)[:MAX_MESSAGE_LENGTH] + "\n...（响应过长，已截断）"
+                self._stream_chunks = [text]
+                self._stream_len = len(text)
+
+            # 更新最后一条消息
+            self._assistant_slot["content"] = ''.join(self._stream_chunks)
+
+            # 只重绘最后一条消息区域
+            self.update_last_message()
+        self._last_stream_flush = time.time()
+
+    def _stream_end(self):
+        """流式响应结束，刷新剩余缓冲并返回完整文本"""
+        self._flush_stream()
+        return ''.join(self._stream_chunks)
+
     def send_openai_request(self, messages_to_send):
         """使用OpenAI库发送请求"""
+        # 惰性导入，避免拖慢启动。导入失败也要走错误消息路径：
+        # 本方法在线程池里运行，裸抛异常用户只会看到"正在思考..."卡住
+        try:
+            import openai
+        except ImportError as e:
+            self.add_system_message(f"发生错误: {str(e)}", is_error=True)
+            return
+
         try:
             # 流式请求
             response = openai.ChatCompletion.create(
@@ -1235,28 +1744,18 @@ class ChatUI:
                 api_key=self.current_config.api_key,
                 headers=self.current_config.headers
             )
-            
-            full_response = ""
+
+            self._stream_begin()
             for chunk in response:
                 if 'choices' in chunk and len(chunk['choices']) > 0:
                     choice = chunk['choices'][0]
                     if 'delta' in choice and 'content' in choice['delta']:
-                        content = choice['delta']['content']
-                        full_response += content
-                        
-                        # 截断过长的响应
-                        if len(full_response) > MAX_MESSAGE_LENGTH:
-                            full_response = full_response[:MAX_MESSAGE_LENGTH] + "\n...（响应过长，已截断）"
-                        
-                        # 更新最后一条消息
-                        self.messages[-1] = {"role": "assistant", "content": full_response}
-                        
-                        # 只重绘最后一条消息区域
-                        self.update_last_message()
-            
+                        self._stream_add(choice['delta']['content'])
+            full_response = self._stream_end()
+
             if not full_response:
                 self.add_system_message("<AI未返回有效响应>")
-            
+
         except openai.error.APIError as e:
             self.add_system_message(f"API错误: {str(e)}", is_error=True)
         except Exception as e:
@@ -1264,6 +1763,14 @@ class ChatUI:
     
     def send_curl_request(self, messages_to_send):
         """使用Requests库发送自定义请求"""
+        # 惰性导入，避免拖慢启动。导入失败也要走错误消息路径：
+        # 本方法在线程池里运行，裸抛异常用户只会看到"正在思考..."卡住
+        try:
+            import requests
+        except ImportError as e:
+            self.add_system_message(f"发生错误: {str(e)}", is_error=True)
+            return
+
         try:
             # 构建请求体 - 根据是否为Infini格式调整
             if self.current_config.is_infini:
@@ -1279,21 +1786,10 @@ class ChatUI:
                     "stream": True
                 }
             
-            # 设置请求头
-            headers = {
-                "Authorization": f"Bearer {self.current_config.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # 添加自定义头部
-            if self.current_config.headers:
-                headers.update(self.current_config.headers)
-            
-            # 发送请求
-            response = requests.post(
+            # 发送请求（复用配置自身的会话：连接池 + 预设头部）
+            response = self.current_config.session.post(
                 self.current_config.api_base,
                 json=payload,
-                headers=headers,
                 stream=not self.current_config.is_infini  # Infini格式不使用流式
             )
             
@@ -1310,7 +1806,7 @@ class ChatUI:
                         choice = data["choices"][0]
                         if "message" in choice and "content" in choice["message"]:
                             full_response = choice["message"]["content"]
-                            self.messages[-1] = {"role": "assistant", "content": full_response}
+                            self._assistant_slot["content"] = full_response
                             self.update_last_message()
                         else:
                             self.add_system_message("API响应格式不兼容", is_error=True)
@@ -1320,50 +1816,50 @@ class ChatUI:
                     self.add_system_message(f"解析响应出错: {str(e)}", is_error=True)
                 return
             
-            # 处理流式响应
-            full_response = ""
-            for line in response.iter_lines():
+            # 处理流式响应（加大读块，SSE行保持bytes直到JSON解析）
+            self._stream_begin()
+            for line in response.iter_lines(chunk_size=8192):
                 # 过滤心跳包
                 if not line:
                     continue
-                
+
                 # 尝试解析JSON
                 try:
-                    # 移除 "data: " 前缀 (如果存在)
-                    line_str = line.decode('utf-8')
-                    if line_str.startswith("data: "):
-                        line_str = line_str[6:]
-                    
-                    data = json.loads(line_str)
-                    
+                    # 移除 "data: " 前缀 (如果存在)；
+                    # 前缀判断和解析都在bytes上进行，省去每行一次decode
+                    if line.startswith(b"data: "):
+                        line = line[6:]
+
+                    # 快速路径：无结束标志且content不含转义时，
+                    # 正则直取增量文本，跳过整个dict的构建
+                    if _SSE_DONE_RE.search(line) is None:
+                        m = _SSE_CONTENT_RE.search(line)
+                        if m is not None:
+                            raw = m.group(1)
+                            if b'\\' not in raw:
+                                self._stream_add(raw.decode('utf-8'))
+                                continue
+
+                    data = _json.loads(line)
+
                     # 检查是否有内容
                     if "choices" in data and len(data["choices"]) > 0:
                         choice = data["choices"][0]
                         if "delta" in choice and "content" in choice["delta"]:
-                            content = choice["delta"]["content"]
-                            full_response += content
-                            
-                            # 截断过长的响应
-                            if len(full_response) > MAX_MESSAGE_LENGTH:
-                                full_response = full_response[:MAX_MESSAGE_LENGTH] + "\n...（响应过长，已截断）"
-                            
-                            # 更新最后一条消息
-                            self.messages[-1] = {"role": "assistant", "content": full_response}
-                            
-                            # 只重绘最后一条消息区域
-                            self.update_last_message()
-                    
+                            self._stream_add(choice["delta"]["content"])
+
                     # 检查是否结束
                     if data.get("done", False) or data.get("finish_reason", None):
                         break
-                    
-                except json.JSONDecodeError:
-                    # 忽略非JSON行
+
+                except ValueError:
+                    # 忽略非JSON行（stdlib与orjson的解析错误都是ValueError子类）
                     pass
                 except Exception as e:
                     self.add_system_message(f"解析错误: {str(e)}", is_error=True)
                     break
-            
+
+            full_response = self._stream_end()
             if not full_response:
                 self.add_system_message("<AI未返回有效响应>")
             
@@ -1381,82 +1877,48 @@ class ChatUI:
         self.input_history.insert(0, self.current_input)
         self.history_index = -1
         
-        # 处理文件标记 - 只在发送给AI时展开
-        processed_input = self.current_input
-        for placeholder, file_path in self.file_placeholders.items():
-            if placeholder in processed_input:
-                try:
-                    # 检查文件是否存在
-                    if not os.path.exists(file_path):
-                        processed_input = processed_input.replace(placeholder, f"[文件不存在: {file_path}]")
-                        continue
-                    
-                    # 检查文件大小
-                    file_size = os.path.getsize(file_path)
-                    if file_size > MAX_FILE_SIZE:
-                        processed_input = processed_input.replace(placeholder, f"[文件过大(>{MAX_FILE_SIZE/1024}KB): {file_path}]")
-                        continue
-                    
-                    # 读取文件内容
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # 替换标记
-                    processed_input = processed_input.replace(placeholder, f"\n```文件内容:{file_path}\n{content}\n```\n")
-                
-                except Exception as e:
-                    processed_input = processed_input.replace(placeholder, f"[读取文件出错: {str(e)}]")
-        
-        # 截断过长的消息
-        if len(processed_input) > MAX_MESSAGE_LENGTH:
-            processed_input = processed_input[:MAX_MESSAGE_LENGTH] + "\n...（消息过长，已截断）"
-        
+        # 文件占位符保持标记形式存入消息，仅在下面构建发送列表时展开为文件内容
+
         # 添加用户消息
+        if self._first_user_msg is None:
+            self._first_user_msg = self.current_input
         self.messages.append({"role": "user", "content": self.current_input})
         self.dirty = True  # 标记需要重绘消息区域
         self.redraw(force=True)
         
-        # 构建要发送的消息列表（排除系统消息）
-        messages_to_send = []
+        # 构建要发送的消息列表（排除系统消息），只保留最近的10条：
+        # deque(maxlen=10) 的追加和淘汰都是O(1)，不像 list.pop(0) 每次搬移整个列表
+        buf = collections.deque(maxlen=10)
         for msg in self.messages:
             # 只发送用户和AI消息，不发送系统消息
             if msg["role"] == "system":
                 continue
-                
+
             if msg["role"] == "user":
-                # 对用户消息中的文件占位符进行替换
-                content = replace_file_tags(msg["content"])
+                # 对用户消息中的文件占位符进行替换（标记 -> {{:F}}标签 -> 文件内容）
+                # 文件内容本身有 (mtime, size) 缓存，重复发送不会重新读盘
+                content = replace_file_tags(self._markers_to_tags(msg["content"]))
             else:
                 content = msg["content"]
-                
-            # 只保留最近的10条消息
-            if len(messages_to_send) < 10:
-                messages_to_send.append({"role": msg["role"], "content": content})
-            else:
-                # 移除最旧的消息
-                messages_to_send.pop(0)
-                messages_to_send.append({"role": msg["role"], "content": content})
+
+            buf.append({"role": msg["role"], "content": content})
+        messages_to_send = list(buf)
         
         # 添加AI消息占位符
-        self.messages.append({"role": "assistant", "content": "正在思考..."})
+        # 占位dict同时作为流式写入的稳定槽位：
+        # 后续chunk原地改content，不再每次刷新都分配新dict
+        self._assistant_slot = {"role": "assistant", "content": "正在思考..."}
+        self.messages.append(self._assistant_slot)
         self.dirty = True
         self.redraw(force=True)
         
-        # 根据配置选择请求方式
+        # 根据配置选择请求方式，提交到线程池执行避免阻塞UI
         if self.current_config.request_type == "curl":
-            # 使用线程发送请求，避免阻塞UI
-            threading.Thread(
-                target=self.send_curl_request,
-                args=(messages_to_send,),
-                daemon=True
-            ).start()
+            future = self._executor.submit(self.send_curl_request, messages_to_send)
         else:  # 默认为openai方式
-            # 使用线程发送请求，避免阻塞UI
-            threading.Thread(
-                target=self.send_openai_request,
-                args=(messages_to_send,),
-                daemon=True
-            ).start()
+            future = self._executor.submit(self.send_openai_request, messages_to_send)
+        # 线程池会吞掉任务里未捕获的异常，挂回调兜底上报
+        future.add_done_callback(self._report_send_failure)
         
         # 清空输入
         self.current_input = ""
@@ -1464,134 +1926,92 @@ class ChatUI:
         self.redraw_input_only()
         return False
     
+    def _report_send_failure(self, future):
+        """线程池任务的兜底错误上报：send_*内部没接住的异常不再无声丢失"""
+        if future.cancelled():
+            # 退出时shutdown(cancel_futures=True)会取消排队中的任务
+            return
+        exc = future.exception()
+        if exc is not None:
+            self.add_system_message(f"发生错误: {exc}", is_error=True)
+
     def update_last_message(self):
-        """只更新最后一条消息的显示 - 修复版本，添加自动换行"""
-        # 计算消息显示区域
-        start_line = 2  # 从第三行开始
-        end_line = self.height - 3
-        
-        # 清除最后两条消息的区域
-        # 计算需要清除的行数（基于最后两条消息的实际行数）
-        lines_to_clear = 0
-        for msg in self.messages[-2:]:
+        """只更新最后一条消息的显示 - 修复版本，添加自动换行（绘制到 msg_win）"""
+        # 消息区即整个 msg_win
+        start_line = 0
+        end_line = self.msg_height
+
+        # 只显示最后两条消息（排除系统消息）：
+        # 倒数第二条在流式期间不变，整条缓存；最后一条增量换行
+        display_lines = []
+        tail = self.messages[-2:]
+        for idx, msg in enumerate(tail):
             # 跳过系统消息
             if msg["role"] == "system":
                 continue
-                
-            content = msg["content"]
-            # 估算行数：内容长度除以终端宽度，加上换行符
-            lines_to_clear += max(1, (len(content) // self.width) + 1)
-        
-        # 确保不会清除到标题区域
-        clear_start = max(start_line, end_line - lines_to_clear - 2)
-        
+
+            if idx == len(tail) - 1:
+                display_lines.extend(self._wrap_streaming_tail(msg))
+            else:
+                key = (id(msg), self.width, len(msg["content"]))
+                if key != self._penult_wrap_key:
+                    self._penult_wrap_key = key
+                    self._penult_wrap_lines = self._wrap_message(msg)
+                display_lines.extend(self._penult_wrap_lines)
+
+        # 按实际行数清除区域（保留2行余量覆盖上一帧的残留）
+        clear_start = max(start_line, end_line - len(display_lines) - 2)
+
         for i in range(clear_start, end_line):
             try:
-                self.stdscr.move(i, 0)
-                self.stdscr.clrtoeol()
+                self.msg_win.move(i, 0)
+                self.msg_win.clrtoeol()
             except:
                 pass
-        
-        # 只显示最后两条消息（排除系统消息）
-        display_lines = []
-        for msg in self.messages[-2:]:
-            # 跳过系统消息
-            if msg["role"] == "system":
-                continue
-                
-            role = msg["role"]
-            content = msg["content"]
-            
-            if role == "user":
-                prefix = "用户: "
-                color = curses.color_pair(2)
-            elif role == "assistant":
-                prefix = "AI: "
-                color = curses.color_pair(3)
-            else:
-                prefix = "系统: "
-                color = curses.color_pair(4)
-            
-            # 处理文件内容标记
-            if "```文件内容:" in content:
-                parts = content.split("```文件内容:")
-                for i, part in enumerate(parts):
-                    if i > 0:
-                        file_part = part.split("```", 1)
-                        if len(file_part) > 1:
-                            display_lines.append(("文件内容:" + file_part[0], curses.color_pair(5)))
-                            display_lines.append((file_part[1], color))
-                        else:
-                            display_lines.append(("文件内容:" + file_part[0], curses.color_pair(5)))
-                    else:
-                        display_lines.append((part, color))
-            else:
-                # 在用户界面显示占位符而不是文件内容
-                display_content = content
-                for placeholder, file_path in self.file_placeholders.items():
-                    if placeholder in display_content:
-                        display_content = display_content.replace(placeholder, f"{{{{:F{file_path}}}}}")
-                
-                # 添加前缀
-                display_content = prefix + display_content
-                
-                # 正确处理换行：先按原始换行符分割
-                lines = display_content.split('\n')
-                for line in lines:
-                    # 对每一行进行自动换行处理
-                    wrapped_lines = textwrap.wrap(line, self.width)
-                    if wrapped_lines:
-                        for wrapped_line in wrapped_lines:
-                            display_lines.append((wrapped_line, color))
-                    else:
-                        # 空行
-                        display_lines.append(("", color))
-        
+
         # 显示消息（从底部向上）
         line_index = len(display_lines) - 1
         row = end_line - 1
-        
+
         # 确保不会覆盖输入区域
-        max_row = self.height - 4
-        
+        max_row = self.msg_height - 1
+
         while row >= max_row and line_index >= 0:
             line, color = display_lines[line_index]
-            self.safe_addstr(row, 0, line, color)
+            self.safe_addstr(row, 0, line, color, win=self.msg_win)
             row -= 1
             line_index -= 1
-        
-        # 重新显示输入区域（确保位置正确）
-        try:
-            # 清除分隔线和输入行
-            self.stdscr.move(self.height - 3, 0)
-            self.stdscr.clrtoeol()
-            self.stdscr.hline(self.height - 3, 0, curses.ACS_HLINE, self.width)
-            
-            self.stdscr.move(self.height - 2, 0)
-            self.stdscr.clrtoeol()
-            
-            self.stdscr.move(self.height - 1, 0)
-            self.stdscr.clrtoeol()
-        except:
-            pass
-        
+
+        self.msg_win.noutrefresh()
+
+        # 重新显示输入区域（确保光标位置正确）。
+        # 本方法在网络工作线程上被调用，主线程此时阻塞在读键上，
+        # 必须自己doupdate把流式内容推上屏
         self.display_input()
         self.display_help()
-        self.stdscr.refresh()
-    
+        self._refresh_input_win()
+        curses.doupdate()
+
     def add_system_message(self, message, is_error=False):
         """添加系统消息"""
-        color = curses.color_pair(6) if is_error else curses.color_pair(4)
+        color = self._COLOR_ERR if is_error else self._COLOR_SYS
         # 截断过长的系统消息
         if len(message) > MAX_MESSAGE_LENGTH:
             message = message[:MAX_MESSAGE_LENGTH] + " ...（消息过长，已截断）"
             
         self.messages.append({
-            "role": "system", 
+            "role": "system",
             "content": message
         })
         self.dirty = True  # 标记需要重绘消息区域
-        self.redraw(force=True)
+        # 非强制重绘：连续多条系统消息（clean确认、加载提示等）在
+        # 限流窗口内合并成一次整屏重绘；被跳过时主循环的读键超时
+        # 会在窗口结束后补画，最后一帧不会丢
+        if self.redraw():
+            # 本方法也会在网络线程的错误路径上被调用，此时主线程
+            # 阻塞在读键上，需要自己提交屏幕更新
+            self._needs_refresh = False
+            curses.doupdate()
 
 def chat_ui(stdscr, configs):
     # 设置UTF-8支持
@@ -1613,12 +2033,31 @@ def chat_ui(stdscr, configs):
     
     # 主循环
     while True:
-        ui.redraw()
-        key = stdscr.getch()
+        # 补画被限流跳过的重绘；常规按键由各处理分支自行重绘
+        if ui._redraw_pending:
+            ui.redraw()
+        # 一个按键事件中的多次重绘只在这里提交一次物理屏幕更新
+        if ui._needs_refresh:
+            ui._needs_refresh = False
+            curses.doupdate()
+        # 读键带超时：限流窗口内被跳过的重绘（包括网络线程上的系统
+        # 消息）在下一次超时醒来时补画，不必等到用户按键。
+        # 每轮重设超时，因为文件/历史等子界面会切回阻塞读键
+        stdscr.timeout(KEY_TIMEOUT_MS)
+        # get_wch 在ncurses内部完成宽字符组装：普通字符（含多字节
+        # UTF-8）返回str，功能键返回int，每个按键只需一次系统调用
+        try:
+            key = stdscr.get_wch()
+        except curses.error:
+            # 超时无输入：回到循环顶部检查待补的重绘
+            continue
         exit_flag = ui.process_input(key)
         if exit_flag:
             break
 
+    # 退出时丢弃未开始的请求，不等待进行中的任务
+    ui._executor.shutdown(wait=False, cancel_futures=True)
+
 def chat(configs):
     """
      curses.wrapper 初始化终端环境。